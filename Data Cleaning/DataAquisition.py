@@ -1,102 +1,189 @@
-from logging import raiseExceptions
-from re import X
-from socket import timeout
 import pandas as pd
-from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
-from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.action_chains import ActionChains 
-import time
+import re
 
 path = "C:\Program Files (x86)\chromedriver.exe"
 
-driver = webdriver.Chrome(path)
+# thumbnails, fonts, video and ad scripts play no part in the scraped text fields
+blocked_urls = [
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.svg", "*.woff*", "*.ttf", "*.mp4",
+    "*googlesyndication*", "*doubleclick*", "*googletagmanager*", "*/analytics*",
+]
+
+options = webdriver.ChromeOptions()
+# driver.get returns at DOMContentLoaded; car_data's first round waits for the sources to render
+options.page_load_strategy = "eager"
+options.add_argument("--blink-settings=imagesEnabled=false")
+
+driver = webdriver.Chrome(path, options=options)
+driver.execute_cdp_cmd("Network.enable", {})
+driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_urls})
 
 input_make = "hyundai"      #input(f'Make:{str()}').casefold()
 input_model = "veloster"        #input(f'Model:{str()}').casefold()
 input_zip = "33186"      #input(f'Zip:{int(max=5)}')
 input_radius = "50"       #input(f'Radius:{str(max=4)}')
 
+delivery_label = f"delivers to {input_zip}"
+
 
 driver.get(f'https://www.autotempest.com/results?radius={input_radius}&zip={input_zip}')
 
-continue_buttons_xpath = {
-    "autotempest" : "/html/body/div[1]/div[3]/section[1]/section/section[2]/section/button", 
-    "cars" : "/html/body/div[1]/div[3]/section[1]/section/section[3]/section/button",
-    "carvana" : "/html/body/div[1]/div[3]/section[1]/section/section[4]/section/button",
-    "ebay" : "/html/body/div[1]/div[3]/section[1]/section/section[5]/section/button",
-    "truecar" : "/html/body/div[1]/div[3]/section[1]/section/section[6]/section/button",
-    "other" : "/html/body/div[1]/div[3]/section[1]/section/section[8]/section/button",
+results_css = "body > div:nth-of-type(1) > div:nth-of-type(3) > section:nth-of-type(1) > section"
+
+# "<year> <make> <model> <trim...>" from the listing title
+name_pattern = re.compile(r"(\S+)\s+(\S+)\s+(\S+)\s*(.*)")
+
+continue_buttons = {
+    "autotempest" : (By.CSS_SELECTOR, f"{results_css} > section:nth-of-type(2) > section > button"),
+    "cars" : (By.CSS_SELECTOR, f"{results_css} > section:nth-of-type(3) > section > button"),
+    "carvana" : (By.CSS_SELECTOR, f"{results_css} > section:nth-of-type(4) > section > button"),
+    "ebay" : (By.CSS_SELECTOR, f"{results_css} > section:nth-of-type(5) > section > button"),
+    "truecar" : (By.CSS_SELECTOR, f"{results_css} > section:nth-of-type(6) > section > button"),
+    "other" : (By.CSS_SELECTOR, f"{results_css} > section:nth-of-type(8) > section > button"),
 }
     
-def click_button(xpath):
-    WebDriverWait(driver,10).until(EC.element_to_be_clickable((By.XPATH, xpath)))
-    button = driver.find_element(By.XPATH, xpath)
+# each round waits up to button_timeout for the active sources' buttons; a source is
+# dropped after max_button_failures consecutive rounds without a clickable button.
+# driver.get returns at DOMContentLoaded, before the sources' results have rendered,
+# so the first round gets first_round_timeout instead
+button_timeout = 3
+first_round_timeout = 20
+max_button_failures = 3
+
+# resolves with which continue buttons are present, enabled and rendered as soon as all of
+# them are, re-checking on DOM mutations instead of polling, or with the partial state on timeout
+buttons_ready_js = """
+const [selectors, timeoutMs, done] = arguments;
+const check = () => selectors.map(sel => {
+    const el = document.querySelector(sel);
+    return !!(el && !el.disabled && el.offsetParent);
+});
+const flags = check();
+if (flags.every(Boolean)) return done(flags);
+const finish = () => {
+    observer.disconnect();
+    clearTimeout(timer);
+    done(check());
+};
+const observer = new MutationObserver(() => {
+    if (check().every(Boolean)) finish();
+});
+const timer = setTimeout(finish, timeoutMs);
+observer.observe(document.body, {childList: true, subtree: true, attributes: true});
+"""
+
+driver.set_script_timeout(max(button_timeout, first_round_timeout) + 5)
+
+def ready_buttons(names, timeout):
+    selectors = [continue_buttons[name][1] for name in names]
+    flags = driver.execute_async_script(buttons_ready_js, selectors, timeout * 1000)
+    return {name for name, ready in zip(names, flags) if ready}
+
+# built once and reused for every click
+click_wait = WebDriverWait(driver,2,poll_frequency=0.1)
+button_conditions = {name : EC.element_to_be_clickable(locator) for name, locator in continue_buttons.items()}
+
+def click_button(name):
+    try:
+        button = click_wait.until(button_conditions[name])
+    except TimeoutException:
+        return False
     ActionChains(driver).move_to_element(button).click().perform()
+    return True
     
+# runs in the page and returns [price, mileage, title, distance] text per card (null when missing),
+# so only these fields cross the driver connection instead of the whole serialized DOM
+card_fields_js = """
+const text = (card, sel) => {
+    const el = card.querySelector(sel);
+    return el ? el.textContent : null;
+};
+return Array.from(document.querySelectorAll("div.description-wrap"), card => [
+    text(card, "div.badge__label.label--price"),
+    text(card, "span.info.mileage"),
+    text(card, "a.listing-link.source-link"),
+    text(card, "span.distance"),
+]);
+"""
+
+# first run of digits and thousands separators, so "$12,345" / "45,000 mi." parse as ints;
+# anything after it (a second price, a unit suffix) is ignored
+number_pattern = re.compile(r"\d[\d,]*")
+int32_max = 2**31 - 1
+int16_max = 2**15 - 1
+
+def to_number(text, limit=int32_max):
+    if text == None:
+        return None
+    number_match = number_pattern.search(text)
+    if number_match == None:
+        return None
+    digits = number_match.group().replace(",", "")
+    if not digits.isdecimal():
+        return None
+    number = int(digits)
+    # out-of-range values become <NA> rather than failing the nullable-int column
+    if number > limit:
+        return None
+    return number
+
 def car_df():
-    html = driver.page_source
-    soup = BeautifulSoup(html, "html.parser")
-    section_card = soup.find_all("div", class_="description-wrap")
-    
-    car_dictionary = {
-        "price" : [],
-        "mileage" : [],
-        "year" : [],
-        "make" : [],
-        "model" : [],
-        "trim" : [],
-        "distance from zip" : []
-        }
-
-    for section in section_card:
-        price = section.find("div", class_= "badge__label label--price")
-        if price != None:
-            price_car = price.text
-            car_dictionary["price"].append(price_car)
-        else:
-            car_dictionary["price"].append("Inquire")
-
-        mileage = section.find("span", class_="info mileage")
-        if mileage != None:
-            mileage_car = mileage.text
-            car_dictionary["mileage"].append(mileage_car)
-        else:
-            car_dictionary["mileage"].append(f"None")
-                        
-        name = section.find("a", class_="listing-link source-link")
+    cards = driver.execute_script(card_fields_js)
+
+    # missing or non-numeric prices ("Inquire") and mileages become <NA>
+    prices = [to_number(card[0]) for card in cards]
+    mileages = [to_number(card[1]) for card in cards]
+    distances = [card[3] if card[3] != None else delivery_label for card in cards]
+
+    # columns are filled by card index so a card without a title keeps every row aligned
+    card_count = len(cards)
+    years = [None] * card_count
+    makes = [None] * card_count
+    models = [None] * card_count
+    trims = [None] * card_count
+    for i, card in enumerate(cards):
+        name = card[2]
         if name != None:
-            name_car = name.text.strip().split(" ")
-            car_dictionary["year"].append(name_car[0])
-            car_dictionary["make"].append(name_car[1])
-            car_dictionary["model"].append(name_car[2])
-            car_dictionary["trim"].append(name_car[3:])
-            
-        distance = section.find("span", class_="distance")
-        if distance != None:
-            distance_car = distance.text
-            car_dictionary["distance from zip"].append(distance_car)
-        else:
-            car_dictionary["distance from zip"].append(f"delivers to {input_zip}")
-                        
-    car_dataframe = pd.DataFrame.from_dict(car_dictionary)
+            name_match = name_pattern.match(name.strip())
+            if name_match != None:
+                year, makes[i], models[i], trims[i] = name_match.groups()
+                years[i] = to_number(year, int16_max)
+
+    car_dataframe = pd.DataFrame({
+        "price" : pd.array(prices, dtype="Int32"),
+        "mileage" : pd.array(mileages, dtype="Int32"),
+        "year" : pd.array(years, dtype="Int16"),
+        "make" : pd.Categorical(makes),
+        "model" : pd.Categorical(models),
+        "trim" : trims,
+        "distance from zip" : distances
+        }, copy=False)
     
     print(car_dataframe)
     
     return car_dataframe
 
 def car_data():
-    while True:
-        try:
-            for button in continue_buttons_xpath.values():
-                click_button(button)
-        except TimeoutException
-            print("timeout session")
-            break    
+    active_buttons = list(continue_buttons)
+    failures = {name : 0 for name in continue_buttons}
+    timeout = first_round_timeout
+    while active_buttons:
+        ready = ready_buttons(active_buttons, timeout)
+        timeout = button_timeout
+        for name in list(active_buttons):
+            if name in ready and click_button(name):
+                failures[name] = 0
+                continue
+            failures[name] += 1
+            if failures[name] >= max_button_failures:
+                print(f"{name}: no more results")
+                active_buttons.remove(name)
 
 if __name__ == "__main__":
     car_data()